@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# Ryu-free parts of sdn_router_rest: the CSR k-shortest-path search, port
+# stats storage and its views, multipart stats reply assembly and the bookkeeping of
+# route batches awaiting barrier replies, and ETag tagging. Kept apart from the app so they
+# import (and are tested) without a controller.
+
+from heapq import heappush, heappop
+from operator import attrgetter
+import random
+import numpy as np
+from sdn_router_dijkstra import dijkstra_csr
+
+INF = float('inf')
+_COUNTER_UNSUPPORTED = np.uint64(2**64 - 1)
+
+
+# Counters of a port stats record, in the column order of port_stat_matrix
+PORT_STAT_FIELDS = ('rx_bytes', 'tx_bytes', 'rx_pkts', 'tx_pkts',
+                    'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors')
+_port_stat_attrs = attrgetter('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets',
+                              'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors')
+
+
+def port_stat_matrix(body):
+    """Counters of a port stats reply as a uint64 (P, 8) matrix, one row
+    per OFPPortStats entry, columns as in PORT_STAT_FIELDS."""
+    return np.array([_port_stat_attrs(s) for s in body],
+                    dtype=np.uint64).reshape(-1, len(PORT_STAT_FIELDS))
+
+
+def port_counters(stats):
+    """(tx_bytes, rx_bytes, tx_pkts, rx_pkts) per row of a port_stat_matrix,
+    as an int64 matrix. A counter the switch does not support comes as
+    all-ones (2**64-1) and reads as 0."""
+    c = stats[:, [1, 0, 3, 2]]
+    c[c == _COUNTER_UNSUPPORTED] = 0
+    return c.astype(np.int64)
+
+
+def counters_unchanged(stored, ports, stats):
+    """True if a reply repeats a switch's stored (ts, ports, stats): same
+    ports, and no counter moved, drops and errors included."""
+    return stored is not None and stored[1] == ports and np.array_equal(stored[2], stats)
+
+
+def port_stat_records(dpid, ts, ports, stats):
+    """Row view of one switch's stored stats: one record per port."""
+    return [{'timestamp': ts, 'dpid': dpid, 'port_no': p, **dict(zip(PORT_STAT_FIELDS, row))}
+            for p, row in zip(ports, stats.tolist())]
+
+
+def port_stat_columns(stored):
+    """Columnar view ({column: [values]}) of {dpid: (ts, ports, stats)}."""
+    items = list(stored.items())
+    if items:
+        stats = np.concatenate([s for _, (_, _, s) in items])
+    else:
+        stats = np.zeros((0, len(PORT_STAT_FIELDS)), dtype=np.uint64)
+    cols = {'dpid': [d for d, (_, ports, _) in items for _ in ports],
+            'port_no': [p for _, (_, ports, _) in items for p in ports]}
+    cols.update(zip(PORT_STAT_FIELDS, stats.T.tolist()))
+    cols['timestamp'] = [ts for _, (ts, ports, _) in items for _ in ports]
+    return cols
+
+
+class CSRGraph:
+    """
+    Immutable CSR snapshot of the switch graph for k-shortest-path search.
+    Nodes are renumbered in dpid order; indptr/indices/weights are the
+    usual compressed-row arrays, with neighbours sorted so searches (and
+    their tie-breaks) are deterministic. Being immutable, a snapshot can
+    be searched from another thread while the live graph keeps changing.
+    """
+
+    def __init__(self, G):
+        self.nodes = sorted(G.nodes())
+        self.index = {n: i for i, n in enumerate(self.nodes)}
+        n = len(self.nodes)
+        edges = [(self.index[u], self.index[v], d.get('weight', 1))
+                 for u, v, d in G.edges(data=True)]
+        e = np.array([(u, v) for u, v, _ in edges], dtype=np.int64).reshape(-1, 2)
+        w = np.array([c for _, _, c in edges], dtype=np.float64)
+        order = np.lexsort((e[:, 1], e[:, 0]))
+        self.indices = e[order, 1]
+        self.weights = w[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(e[:, 0], minlength=n), out=self.indptr[1:])
+        # The searches below are scalar loops: walk plain-int rows, not numpy
+        ip, ix, wt = self.indptr.tolist(), self.indices.tolist(), self.weights.tolist()
+        self._adj = [list(zip(ix[ip[i]:ip[i + 1]], wt[ip[i]:ip[i + 1]])) for i in range(n)]
+        self._w = {(u, v): c for u, v, c in edges}
+        # Without weights the fewest-hop paths can be read off one BFS
+        self._unit = all(c == 1 for _, _, c in edges)
+        self._radj = [[] for _ in range(n)]
+        for u, v, _ in edges:
+            self._radj[v].append(u)
+        if dijkstra_csr is not None:
+            # (u, v) -> CSR slot, to turn banned edges into a slot mask
+            self._slot = {(i, ix[p]): p for i in range(n) for p in range(ip[i], ip[i + 1])}
+
+    def _dijkstra(self, s, t, banned_nodes, banned_edges, bound=INF):
+        """(cost, [s..t]) avoiding the banned nodes/edges, or None if t is
+        unreachable or costs more than bound."""
+        if dijkstra_csr is not None:
+            return self._dijkstra_compiled(s, t, banned_nodes, banned_edges, bound)
+        adj = self._adj
+        dist = {s: 0.0}
+        prev = {}
+        heap = [(0.0, s)]
+        while heap:
+            d, u = heappop(heap)
+            if d > bound:
+                return None
+            if u == t:
+                break
+            if d > dist[u]:
+                continue
+            for v, c in adj[u]:
+                if v in banned_nodes or (u, v) in banned_edges:
+                    continue
+                nd = d + c
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    prev[v] = u
+                    heappush(heap, (nd, v))
+        else:
+            return None
+        path = [t]
+        while path[-1] != s:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return d, path
+
+    def _dijkstra_compiled(self, s, t, banned_nodes, banned_edges, bound):
+        node_ban = np.zeros(len(self.nodes), dtype=np.bool_)
+        if banned_nodes:
+            node_ban[list(banned_nodes)] = True
+        edge_ban = np.zeros(len(self.indices), dtype=np.bool_)
+        if banned_edges:
+            edge_ban[[self._slot[e] for e in banned_edges]] = True
+        cost, parent = dijkstra_csr(self.indptr, self.indices, self.weights,
+                                    s, t, node_ban, edge_ban, bound)
+        if cost == INF:
+            return None
+        path = [t]
+        while path[-1] != s:
+            path.append(int(parent[path[-1]]))
+        path.reverse()
+        return float(cost), path
+
+    def _distances(self, root, bound, reverse=False):
+        """Distances from root (to root, if reverse) up to bound."""
+        adj, radj, w = self._adj, self._radj, self._w
+        dist = {root: 0.0}
+        heap = [(0.0, root)]
+        while heap:
+            d, u = heappop(heap)
+            if d > bound:
+                break
+            if d > dist[u]:
+                continue
+            for v, c in (((v, w[v, u]) for v in radj[u]) if reverse else adj[u]):
+                nd = d + c
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    heappush(heap, (nd, v))
+        return dist
+
+    def _bfs_shortest(self, s, t, k):
+        """Up to k fewest-hop s->t paths in lexicographic order, walked
+        down the BFS layers around t (unit weights only)."""
+        radj = self._radj
+        dt = {t: 0}
+        frontier = [t]
+        # finish s's layer so every node closer to t is labelled
+        while frontier and s not in dt:
+            nxt = []
+            for v in frontier:
+                for u in radj[v]:
+                    if u not in dt:
+                        dt[u] = dt[v] + 1
+                        nxt.append(u)
+            frontier = nxt
+        if s not in dt:
+            return []
+        adj = self._adj
+        out = []
+        stack = [[s]]
+        while stack and len(out) < k:
+            path = stack.pop()
+            u = path[-1]
+            if u == t:
+                out.append(path)
+                continue
+            d = dt[u] - 1
+            for v, _ in reversed(adj[u]):   # pop in ascending order
+                if dt.get(v) == d:
+                    stack.append(path + [v])
+        return out
+
+    def k_shortest(self, src, dst, k, max_stretch=None):
+        """
+        First k simple paths (Yen), sorted by (length, dpids). With
+        max_stretch, paths costing more than shortest + max_stretch are
+        never generated, which keeps Yen from enumerating long detours
+        on dense meshes; nodes off every path within that bound are
+        pruned from the spur searches. On an unweighted graph with k equally short
+        paths, those are returned without running Yen.
+        """
+        s, t = self.index.get(src), self.index.get(dst)
+        if s is None or t is None or s == t:
+            return []
+        nodes = self.nodes
+        if self._unit:
+            # mesh cores often hold k equally short paths: no Yen needed
+            short = self._bfs_shortest(s, t, k)
+            if not short:
+                return []
+            if len(short) == k:
+                return [[nodes[i] for i in p] for p in short]
+        first = self._dijkstra(s, t, (), ())
+        if first is None:
+            return []
+        w = self._w
+        limit = INF if max_stretch is None else first[0] + max_stretch
+        pruned = set()
+        if limit < INF:
+            # A node no s->t path within the bound can pass through never
+            # needs exploring: ban it from every spur search up front
+            ds = self._distances(s, limit)
+            dt = self._distances(t, limit, reverse=True)
+            pruned = {v for v in range(len(self.nodes))
+                      if ds.get(v, INF) + dt.get(v, INF) > limit}
+        A = [(first[0], first[1], 0)]   # (cost, path, index it deviated at)
+        B = []                          # candidate heap, same tuples
+        seen = {tuple(first[1])}
+        while len(A) < k:
+            _, prev, dev = A[-1]
+            # Spur nodes before the deviation index only reproduce candidates
+            # already generated from the path this one branched off
+            root_cost = sum(w[prev[j], prev[j + 1]] for j in range(dev))
+            for i in range(dev, len(prev) - 1):
+                if i > dev:
+                    root_cost += w[prev[i - 1], prev[i]]
+                if root_cost > limit:
+                    break
+                root = prev[:i + 1]
+                banned_edges = {(p[i], p[i + 1]) for _, p, _ in A if p[:i + 1] == root}
+                spur = self._dijkstra(prev[i], t, pruned.union(root[:-1]), banned_edges,
+                                      limit - root_cost)
+                if spur is None:
+                    continue
+                path = root[:-1] + spur[1]
+                key = tuple(path)
+                if key not in seen:
+                    seen.add(key)
+                    heappush(B, (root_cost + spur[0], path, i))
+            if not B:
+                break
+            A.append(heappop(B))
+        paths = [[nodes[i] for i in p] for _, p, _ in A]
+        # stable order on ties
+        return sorted(paths, key=lambda seq: (len(seq), tuple(seq)))
+
+
+class MultipartReplies:
+    """
+    Reassembles stats replies a switch split into parts flagged with
+    more_flag (OFPMPF_REPLY_MORE), per (dpid, kind).
+    """
+
+    def __init__(self, more_flag):
+        self.more_flag = more_flag
+        self._parts = {}    # (dpid, kind) -> (xid, entries of the parts so far)
+
+    def full_body(self, kind, msg):
+        """Entries of the whole reply once its last part is in, else None.
+        A part with another xid starts a new reply."""
+        key = (msg.datapath.id, kind)
+        if msg.flags & self.more_flag:
+            xid, parts = self._parts.get(key, (None, None))
+            if xid != msg.xid:
+                parts = []
+                self._parts[key] = (msg.xid, parts)
+            parts.extend(msg.body)
+            return None
+        xid, parts = self._parts.pop(key, (None, None))
+        return parts + msg.body if xid == msg.xid else msg.body
+
+    def drop(self, dpid):
+        """Forget the partial replies of a switch that went away."""
+        for key in [k for k in self._parts if k[0] == dpid]:
+            del self._parts[key]
+
+
+class RouteBarriers:
+    """
+    Route batches sent to a switch and not yet confirmed by its barrier
+    reply. A route meta is a dict with 'pending' (dpids still to answer),
+    'committed' and 'failed'; installs are the (key, value) install-cache
+    entries the batch makes true once the switch has processed it.
+    """
+
+    def __init__(self):
+        self._batches = {}  # (dpid, barrier xid) -> (first xid, metas, installs)
+
+    def add(self, dpid, first_xid, barrier_xid, metas, installs):
+        self._batches[(dpid, barrier_xid)] = (first_xid, metas, installs)
+        for meta in metas:
+            meta['pending'].add(dpid)
+
+    def reply(self, dpid, xid):
+        """
+        Barrier answered: the batch's routes stop waiting on dpid, and
+        those no longer waiting on anyone (and not failed) commit. Returns
+        the installs the batch confirmed (empty if it was rejected), or
+        None for a barrier that is not ours.
+        """
+        entry = self._batches.pop((dpid, xid), None)
+        if entry is None:
+            return None
+        _, metas, installs = entry
+        for meta in metas:
+            meta['pending'].discard(dpid)
+            if not meta['pending'] and not meta['failed']:
+                meta['committed'] = True
+        return installs
+
+    def error(self, dpid, xid):
+        """
+        The switch rejected message xid. If it belongs to a route batch,
+        fail the batch's routes, drop its installs and return True.
+        """
+        for (d, last), (first, metas, installs) in self._batches.items():
+            # xids of a batch are consecutive, modulo the 32-bit wrap
+            if d == dpid and (xid - first) & 0xffffffff <= (last - first) & 0xffffffff:
+                installs.clear()
+                for meta in metas:
+                    meta['failed'] = True
+                return True
+        return False
+
+    def switch_down(self, dpid):
+        """
+        dpid disconnected: routes waiting on its barriers will never hear
+        them, so they fail instead of staying uncommitted. Returns True
+        if any did.
+        """
+        gone = [key for key in self._batches if key[0] == dpid]
+        for key in gone:
+            for meta in self._batches.pop(key)[1]:
+                meta['pending'].discard(dpid)
+                meta['failed'] = True
+        return bool(gone)
+
+
+class ETagger:
+    """
+    Weak ETags for bodies cached under a version counter. The counters
+    restart with the process, so every tag carries a random id drawn per
+    instance: an ETag a client kept from before a restart never matches
+    (and never gets a 304 for) a body that merely reuses its version.
+    """
+
+    def __init__(self):
+        self.boot_id = '%012x' % random.getrandbits(48)
+
+    def __call__(self, version):
+        return 'W/"%s.%s"' % (self.boot_id, version)
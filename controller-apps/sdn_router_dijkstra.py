@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Compiled Dijkstra core for the Yen search in sdn_router_rest.CSRGraph.
+# Works on the CSR arrays directly with a binary heap over typed arrays;
+# numba is optional and dijkstra_csr is None when it is not installed.
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # CSRGraph keeps its pure-Python search
+    njit = None
+
+
+def _dijkstra_csr(indptr, indices, weights, s, t, node_ban, edge_ban, bound):
+    """
+    Shortest s->t path avoiding banned nodes and CSR edge slots.
+    Returns (cost, parent); cost is inf when t is unreachable or costs
+    more than bound. Heap entries order by (dist, node), like the heapq
+    search, so ties resolve the same.
+    """
+    n = indptr.shape[0] - 1
+    dist = np.full(n, np.inf)
+    parent = np.full(n, -1, np.int64)
+    done = np.zeros(n, np.bool_)
+    cap = indices.shape[0] + 1
+    hd = np.empty(cap, np.float64)
+    hv = np.empty(cap, np.int64)
+    dist[s] = 0.0
+    hd[0] = 0.0
+    hv[0] = s
+    size = 1
+    while size > 0:
+        d = hd[0]
+        u = hv[0]
+        size -= 1
+        # sift the last entry down from the root
+        ld = hd[size]
+        lv = hv[size]
+        i = 0
+        while True:
+            c = 2 * i + 1
+            if c >= size:
+                break
+            if c + 1 < size and (hd[c + 1] < hd[c] or (hd[c + 1] == hd[c] and hv[c + 1] < hv[c])):
+                c += 1
+            if hd[c] < ld or (hd[c] == ld and hv[c] < lv):
+                hd[i] = hd[c]
+                hv[i] = hv[c]
+                i = c
+            else:
+                break
+        hd[i] = ld
+        hv[i] = lv
+        if done[u]:
+            continue
+        if d > bound:
+            break
+        done[u] = True
+        if u == t:
+            break
+        for e in range(indptr[u], indptr[u + 1]):
+            if edge_ban[e]:
+                continue
+            v = indices[e]
+            if node_ban[v] or done[v]:
+                continue
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent[v] = u
+                # sift the new entry up
+                i = size
+                size += 1
+                while i > 0:
+                    p = (i - 1) // 2
+                    if nd < hd[p] or (nd == hd[p] and v < hv[p]):
+                        hd[i] = hd[p]
+                        hv[i] = hv[p]
+                        i = p
+                    else:
+                        break
+                hd[i] = nd
+                hv[i] = v
+    if not done[t]:
+        return np.inf, parent
+    return dist[t], parent
+
+
+if njit is not None:
+    dijkstra_csr = njit(cache=True)(_dijkstra_csr)
+else:
+    dijkstra_csr = None
+
+
+def warm_up():
+    """Compile (or load from cache) on a 2-node graph, so the first
+    /paths request does not pay the JIT latency."""
+    if dijkstra_csr is None:
+        return
+    dijkstra_csr(np.array([0, 1, 2], np.int64), np.array([1, 0], np.int64),
+                 np.ones(2), 0, 1, np.zeros(2, np.bool_), np.zeros(2, np.bool_), np.inf)
@@ -2,29 +2,123 @@
 # Unified SDN controller app: L2 learning + topology + routing + REST + stats
 
 import os
-from collections import defaultdict
-import hashlib, json, time, networkx as nx
+from collections import defaultdict, deque, OrderedDict
+from itertools import chain
+import gzip, json, random, time, networkx as nx
+from urllib.parse import parse_qsl
+import numpy as np
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet, ether_types
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+from ryu.lib.packet import ether_types
 from ryu.lib import hub
+from eventlet import tpool
 from ryu.topology import event as topo_event
 from ryu.app.wsgi import WSGIApplication, ControllerBase, route
 from webob import Response
-from jsonschema import validate, ValidationError
+from sdn_router_hot import flow_stat_rows
+from sdn_router_dijkstra import warm_up as warm_up_dijkstra
+from sdn_router_core import (INF, CSRGraph, ETagger, MultipartReplies, RouteBarriers,
+                             counters_unchanged, port_counters, port_stat_columns,
+                             port_stat_matrix, port_stat_records)
+
+try:
+    import orjson
+except ImportError:  # fall back to stdlib json
+    orjson = None
+
+try:
+    import fastjsonschema
+except ImportError:  # fall back to a prebuilt jsonschema validator
+    fastjsonschema = None
+
+try:
+    import msgpack
+except ImportError:  # stats are then served as JSON only
+    msgpack = None
 
 API_INSTANCE = 'sdn_router_api'
+_LLDP = ether_types.ETH_TYPE_LLDP.to_bytes(2, 'big')
+_NO_PORTS = frozenset()
+# Upper bound on stats rows kept per switch (a runaway flow table cannot
+# grow the controller's memory without limit)
+MAX_STATS_ROWS = 100000
+# LRU bound on cached k-shortest-path results
+PATH_CACHE_SIZE = 1024
+MAX_ACTION_BODY = 4096     # bytes; route requests are a few dozen
+OPENAPI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'docs', 'openapi.yaml')
+
+_RATE_SCALE = np.array([8.0, 8.0, 1.0, 1.0])   # bytes -> bits; packets as-is
+# Clock for intervals, deadlines and cooldowns: cheaper than time.time() and
+# immune to wall-clock steps. Timestamps shown to clients stay wall-clock.
+_now = time.monotonic
+
+def dumps(obj):
+    """Encode obj to JSON bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str).encode('utf-8')
+
+def iter_json_array(items, chunk=512):
+    """Encode a list as one JSON array, slice by slice, yielding to the hub
+    between slices so a large body never holds up other requests."""
+    yield b'['
+    for i in range(0, len(items), chunk):
+        if i:
+            hub.sleep(0)
+            yield b','
+        yield dumps(items[i:i + chunk])[1:-1]
+    yield b']'
+
+def loads(body):
+    """Decode a JSON request body (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def route_form(params):
+    """ROUTE_SCHEMA-shaped dict from form fields (path given as '1,3,5')."""
+    data = {f: params[f] for f in ('src_mac', 'dst_mac') if f in params}
+    for f in ('k', 'path_id'):
+        if f in params: data[f] = int(params[f])
+    if params.get('path'):
+        data['path'] = [int(x) for x in params['path'].split(',')]
+    return data
+
+def mac_bytes(mac):
+    """6-byte form of a text MAC ('aa:bb:cc:dd:ee:ff'); None if malformed."""
+    try:
+        b = bytes.fromhex(mac.replace(':', ''))
+    except (ValueError, AttributeError):
+        return None
+    return b if len(b) == 6 else None
 
 def j(obj, status=200, headers=None):
-    resp = Response(content_type='application/json',
-                    body=json.dumps(obj, default=str).encode('utf-8'),
-                    status=status)
+    # ready headerlist, as in j_cached: no per-response content-type parsing
+    body = dumps(obj)
+    headerlist = [('Content-Type', 'application/json'),
+                  ('Content-Length', str(len(body)))]
     if headers:
-        for k, v in headers.items():
-            resp.headers[k] = v
-    return resp
+        headerlist.extend(headers.items())
+    return Response(body=body, status=status, headerlist=headerlist)
+
+# /stats bodies are JSON or msgpack depending on Accept
+_VARY_ACCEPT = (('Vary', 'Accept'),)
+
+def wants_msgpack(req):
+    return msgpack is not None and 'application/msgpack' in req.headers.get('Accept', '')
+
+def j_cached(req, body, etag, content_type='application/json', headers=()):
+    """Serve pre-encoded bytes; 304 when the client already has `etag`.
+    Headers are passed as a ready headerlist so webob skips its own
+    content-type/charset/length handling on these hot polling paths."""
+    if req.headers.get('If-None-Match') == etag:
+        return Response(status=304, headerlist=[('ETag', etag)] + list(headers))
+    return Response(body=body, headerlist=[('Content-Type', content_type),
+                                           ('Content-Length', str(len(body))),
+                                           ('ETag', etag)] + list(headers))
 
 ROUTE_SCHEMA = {
     "type": "object",
@@ -39,19 +133,68 @@ ROUTE_SCHEMA = {
     "anyOf": [{"required": ["path_id"]}, {"required": ["path"]}]
 }
 
+# Compile the schema once at import; both error types expose `.message`
+if fastjsonschema is not None:
+    validate_route = fastjsonschema.compile(ROUTE_SCHEMA)
+    RouteValidationError = fastjsonschema.JsonSchemaException
+else:
+    from jsonschema import validators, ValidationError as RouteValidationError
+    _route_validator = validators.validator_for(ROUTE_SCHEMA)(ROUTE_SCHEMA)
+    _route_validator.check_schema(ROUTE_SCHEMA)
+    validate_route = _route_validator.validate
+
 class SDNRouterREST(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
     _CONTEXTS = {'wsgi': WSGIApplication}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.mac_to_port = defaultdict(dict)
-        self.hosts = {}
+        self.mac_to_port = {}         # dpid -> {6-byte MAC: port}, created on features
+        self.hosts = {}               # 6-byte MAC -> {'dpid','port'}; text only at the REST edge
+        self._macs_on_port = {}       # (dpid, port) -> MACs learned there, for purges
+        self._hosts_version = 0     # bumped when a host is learned, moves or is purged
         self.datapaths = {}
         self.G = nx.DiGraph()
         self.core_ports = defaultdict(set)
-        self.k_paths_cached = {}
+        self.k_paths_cached = OrderedDict()  # (paths_version,src,dst,k) -> paths, LRU
+        self._path_index = defaultdict(set)  # directed edge -> cache keys whose paths use it
+        self._edges_removed = 0     # bumped per removal, to spot one during a search
+        self._sp_trees = {}         # src dpid -> {dst dpid: BFS shortest path}
+        self._sp_version = -1       # paths version the BFS trees belong to
+        self._csr = None            # CSRGraph of G at _csr_ver (topology version)
+        self._csr_ver = -1
+        self._hops_cache = {}       # (tuple(dpids), dst_mac) -> hops, for _hops_ver
+        self._hops_ver = None       # (topo version, hosts version)
+        # Path caches follow their own version: removals bump it at once,
+        # link adds only after discovery has been quiet for path_settle_delay
+        self._paths_version = 0
+        self._paths_bump_pending = False
+        self._last_link_add = 0.0
+        self.path_settle_delay = 0.5
+        # k>1 path searches on graphs at least this big run off the hub
+        self.path_offload_min_nodes = 32
+        # PATH_MAX_STRETCH=H: k>1 searches skip paths more than H hops longer
+        # than the shortest one (unset: no bound)
+        try:
+            self.path_max_stretch = float(os.environ["PATH_MAX_STRETCH"])
+        except (KeyError, ValueError):
+            self.path_max_stretch = None
+        # ETags of the cached bodies below: their versions restart at 0 with
+        # the process, the ETagger's boot id does not repeat
+        self.etag = ETagger()
+        self._topo_version = 0      # bumped on every switch/link change
+        self._topo_json_ver = -1
+        self._topo_nodes_json = b'[]'
+        self._topo_links_json = b'[]'
         self.routes = {}
+        self._barriers = RouteBarriers()  # route batches awaiting their barrier reply
+        self._cookie_cache = {}     # (src_mac, dst_mac) -> cookie
+        # last cookie handed out. Random high bits per process: flows a
+        # previous run left on the switches never share a cookie with ours
+        self._cookie_seq = random.getrandbits(32) << 32
+        self._installed = {}        # (dpid, eth_dst bytes) -> (cookie, out_port) on the switch
+        self._routes_version = 0    # bumped on install, commit and delete
+        self._routes_json = (-1, b'[]')
         self.last_action_ts = {}
 
         # cooldown (seconds) between DIFFERENT path changes for a (src,dst)
@@ -60,18 +203,80 @@ class SDNRouterREST(app_manager.RyuApp):
             self.route_cooldown = float(os.environ.get("ROUTE_COOLDOWN", "1.0"))
         except ValueError:
             self.route_cooldown = 1.0
+        # ROUTE_BUNDLES=1: push each switch's share of a route as one atomic
+        # ONF bundle (OF1.3 extension, supported by Open vSwitch)
+        self.use_bundles = os.environ.get("ROUTE_BUNDLES", "0") == "1"
+        self._bundle_seq = 0
 
         # Stats
-        self.port_stats = []
-        self.port_prev = {}
-        self.port_rates = []
-        self.flow_stats = []
+        self.port_stats_by_dpid = {}  # dpid -> (ts, [port_no], uint64[P,8] port_stat_matrix)
+        self.port_prev = {}           # dpid -> (monotonic ts, {port_no: row}, int64[P,4])
+        self.port_rates = {}          # dpid -> {port_no: rate rec} from the latest reply pair
+        self._idle_dpids = set()      # traffic counters unchanged over the last two replies
+        self.flow_stats_by_dpid = {}  # dpid -> deque(rec, maxlen=MAX_STATS_ROWS)
+        self._replies = MultipartReplies(ofproto_v1_3.OFPMPF_REPLY_MORE)
+        # Final counters pushed by switches when a route flow expires
+        self.flow_removed_stats = deque(maxlen=4096)
         self.last_stats_ts = 0.0
+        # Encoded snapshots, refreshed when a reply lands (not per GET)
+        self._port_stats_json = b'[]'
+        self._flow_stats_json = b'[]'
+        self._port_stats_ver = 0
+        self._flow_stats_ver = 0
+        self._port_cols_cache = (-1, b'{}')
+        self._msgpack_cache = {}      # 'ports'/'flows' -> (version, packed bytes)
+        self._port_rates_json = b'[]'
+        self._links_json = (None, b'[]')   # ((stats ver, topo ver), encoded)
+        self._hosts_json = (None, b'[]')   # ((hosts ver, topo ver), encoded)
+        # Replies from all switches land within a few ms of each other;
+        # re-encode once per burst rather than once per reply.
+        self._stats_dirty = set()
+        self._flush_pending = False
+        self.stats_flush_delay = 0.1
+
+        # POLL_COVER=1: poll only a vertex cover of the switch graph plus the
+        # switches with attached hosts (every route starts at one of those).
+        self.poll_cover = os.environ.get("POLL_COVER", "0") == "1"
+        self._poll_set = set()
 
         # Threads
         self.monitor_interval = 2
+        # Route flows report their counters via FlowRemoved, so flow stats
+        # polling is only a heartbeat for still-active flows.
+        try:
+            self.flow_poll_interval = float(os.environ.get("FLOW_POLL_INTERVAL", "30"))
+        except ValueError:
+            self.flow_poll_interval = 30.0
+        self._last_flow_poll = -INF
+        # ...and only while someone reads /stats/flows: a client that reads
+        # at the poll interval stays inside this window
+        self.flow_read_window = 2*self.flow_poll_interval
+        self._flow_stats_last_read = -INF
+        # The next round starts once the interval has passed AND the last
+        # round's replies are in (bounded by one extra interval), so a slow
+        # switch never has requests piling up behind unanswered ones
+        self._outstanding = set()     # (dpid, xid) of unanswered stats requests
+        self._round_done = hub.Event()
+        # PORT_POLL_BACKOFF=N: poll a switch whose byte counters stopped moving
+        # every 2, 4, ... up to N intervals; traffic resets it to every tick
+        try:
+            self.port_poll_backoff = max(1, int(os.environ.get("PORT_POLL_BACKOFF", "1")))
+        except ValueError:
+            self.port_poll_backoff = 1
+        self._port_backoff = {}       # dpid -> current interval multiplier
+        self._port_poll_due = {}      # dpid -> earliest time of the next port poll
         self.monitor_thread = hub.spawn(self._monitor)
-        self.sweep_thread = hub.spawn(self._sweep_core_leaks)
+
+        # Served from memory, plain and gzip-compressed; a GET only stats
+        # the file, and re-reads and recompresses it after an edit
+        self._openapi_bytes = None
+        self._openapi_gzip = None
+        self._openapi_etag = None
+        self._openapi_doc()
+
+        # numba (optional) compiles the Yen inner search; do it before the
+        # first /paths request rather than during it
+        warm_up_dijkstra()
 
         wsgi = kwargs['wsgi']
         wsgi.register(RESTController, {API_INSTANCE: self})
@@ -86,6 +291,8 @@ class SDNRouterREST(app_manager.RyuApp):
         actions = [parser.OFPActionOutput(ofp.OFPP_CONTROLLER, ofp.OFPCML_NO_BUFFER)]
         inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
         dp.send_msg(parser.OFPFlowMod(datapath=dp, priority=0, match=match, instructions=inst))
+        # Fresh table per connection (packet_in falls back to setdefault)
+        self.mac_to_port[dp.id] = {}
         self.logger.info("Installed table-miss on %s", dp.id)
 
     @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -94,40 +301,77 @@ class SDNRouterREST(app_manager.RyuApp):
         if ev.state == MAIN_DISPATCHER:
             self.datapaths[dp.id] = dp
             self.G.add_node(dp.id)
+            self._topo_version += 1
+            self._recompute_poll_set()
         elif ev.state == DEAD_DISPATCHER:
+            # A switch that reconnects under the same dpid reaches MAIN on the
+            # new connection before the old one is closed: that late DEAD
+            # must not tear down the live switch's state
+            if self.datapaths.get(dp.id) is not dp:
+                return
             self.datapaths.pop(dp.id, None)
+            self.mac_to_port.pop(dp.id, None)
+            # Routes waiting on this switch's barrier fail rather than
+            # staying uncommitted forever
+            if self._barriers.switch_down(dp.id):
+                self._routes_version += 1
+            self._forget_installed(dpids=(dp.id,))
             if self.G.has_node(dp.id):
+                gone = list(self.G.in_edges(dp.id)) + list(self.G.out_edges(dp.id))
                 self.G.remove_node(dp.id)
+                self._invalidate_edges(gone)
             self.core_ports.pop(dp.id, None)
-            self.k_paths_cached = {k:v for k,v in self.k_paths_cached.items()
-                                   if dp.id not in (k[0], k[1])}
+            for bucket in (self.port_stats_by_dpid, self.port_prev, self.port_rates,
+                           self.flow_stats_by_dpid,
+                           self._port_backoff, self._port_poll_due):
+                bucket.pop(dp.id, None)
+            self._idle_dpids.discard(dp.id)
+            self._replies.drop(dp.id)
+            self._mark_stats_dirty('ports'); self._mark_stats_dirty('flows')
+            self._topo_version += 1
+            self._recompute_poll_set()
 
     # -------------------- L2 Learning --------------------
     def _purge_hosts_on_port(self, dpid, port_no):
-        bad = [m for m,h in self.hosts.items() if h['dpid']==dpid and h['port']==port_no]
-        for mac in bad: self.hosts.pop(mac, None)
-        if dpid in self.mac_to_port:
-            for mac,p in list(self.mac_to_port[dpid].items()):
-                if p==port_no: self.mac_to_port[dpid].pop(mac)
+        # Only MACs ever learned on this port can be there; an entry may be
+        # stale (the MAC moved on), so check before dropping it
+        table = self.mac_to_port.get(dpid, {})
+        bad = False
+        for mac in self._macs_on_port.pop((dpid, port_no), ()):
+            if table.get(mac) == port_no: del table[mac]
+            h = self.hosts.get(mac)
+            if h is not None and h['dpid'] == dpid and h['port'] == port_no:
+                del self.hosts[mac]; bad = True
+        if bad: self._hosts_version += 1
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
         msg, dp = ev.msg, ev.msg.datapath
         parser, ofp = dp.ofproto_parser, dp.ofproto
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-        if eth.ethertype == ether_types.ETH_TYPE_LLDP: return
+        # Only the Ethernet header is needed: read it straight off the frame
+        data = msg.data
+        if len(data) < 14 or data[12:14] == _LLDP: return
         in_port = msg.match['in_port']
-        src, dst = eth.src, eth.dst
+        dst_b, src_b = bytes(data[0:6]), bytes(data[6:12])  # msg.data may be a bytearray
+        table = self.mac_to_port.setdefault(dp.id, {})
 
-        if in_port not in self.core_ports.get(dp.id,set()):
-            self.mac_to_port[dp.id][src] = in_port
-            self.hosts[src] = {'dpid': dp.id, 'port': in_port}
+        if in_port not in self.core_ports.get(dp.id, _NO_PORTS):
+            old = table.get(src_b)
+            if old != in_port:
+                if old is not None:
+                    self._macs_on_port.get((dp.id, old), set()).discard(src_b)
+                table[src_b] = in_port
+                self._macs_on_port.setdefault((dp.id, in_port), set()).add(src_b)
+            h = self.hosts.get(src_b)
+            if h is None or h['dpid'] != dp.id or h['port'] != in_port:
+                self.hosts[src_b] = {'dpid': dp.id, 'port': in_port}
+                self._hosts_version += 1
 
-        out_port = self.mac_to_port[dp.id].get(dst, ofp.OFPP_FLOOD)
+        out_port = table.get(dst_b, ofp.OFPP_FLOOD)
         actions = [parser.OFPActionOutput(out_port)]
         if out_port != ofp.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_src=src, eth_dst=dst)
+            match = parser.OFPMatch(in_port=in_port, eth_src=src_b.hex(':'),
+                                    eth_dst=dst_b.hex(':'))
             inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
             dp.send_msg(parser.OFPFlowMod(datapath=dp, priority=1, match=match, instructions=inst))
         dp.send_msg(parser.OFPPacketOut(datapath=dp, buffer_id=ofp.OFP_NO_BUFFER,
@@ -142,7 +386,9 @@ class SDNRouterREST(app_manager.RyuApp):
         self.G.add_edge(v,u,u_port=v_p,v_port=u_p)
         self.core_ports[u].add(u_p); self.core_ports[v].add(v_p)
         self._purge_hosts_on_port(u,u_p); self._purge_hosts_on_port(v,v_p)
-        self.k_paths_cached.clear()
+        self._topo_version+=1
+        self._settle_paths()
+        self._recompute_poll_set()
         self.logger.info("Link added %s:%s <-> %s:%s",u,u_p,v,v_p)
 
     @set_ev_cls(topo_event.EventLinkDelete)
@@ -152,126 +398,516 @@ class SDNRouterREST(app_manager.RyuApp):
         if self.G.has_edge(u,v): self.G.remove_edge(u,v)
         if self.G.has_edge(v,u): self.G.remove_edge(v,u)
         self.core_ports[u].discard(u_p); self.core_ports[v].discard(v_p)
-        self.k_paths_cached.clear()
+        self._topo_version+=1
+        # only cached paths over the dead link are wrong; the rest stay k-shortest
+        self._invalidate_edges(((u,v),(v,u)))
+        self._forget_installed(dpids=(u,v))
+        self._recompute_poll_set()
         self.logger.info("Link deleted %s:%s <-> %s:%s",u,u_p,v,v_p)
 
-    def _sweep_core_leaks(self):
-        while True:
-            try:
-                for dpid,ports in self.core_ports.items():
-                    for p in list(ports):
-                        self._purge_hosts_on_port(dpid,p)
-            except Exception as e:
-                self.logger.warning("sweep error: %s",e)
-            hub.sleep(2)
+    def _settle_paths(self):
+        """Invalidate cached paths once, after a burst of link adds settles."""
+        self._last_link_add=_now()
+        if not self._paths_bump_pending:
+            self._paths_bump_pending=True
+            hub.spawn_after(self.path_settle_delay, self._flush_path_invalidation)
+
+    def _flush_path_invalidation(self):
+        quiet=_now()-self._last_link_add
+        if quiet<self.path_settle_delay:
+            hub.spawn_after(self.path_settle_delay-quiet, self._flush_path_invalidation)
+            return
+        self._paths_bump_pending=False
+        self._paths_version+=1
+
+    def _rebuild_topo_json(self):
+        """Re-encode /topology/nodes and /topology/links if the graph changed."""
+        if self._topo_json_ver == self._topo_version: return
+        self._topo_nodes_json = dumps(sorted(self.G.nodes()))
+        self._topo_links_json = dumps([
+            {'src_dpid': u, 'dst_dpid': v,
+             'src_port': data.get('u_port'), 'dst_port': data.get('v_port')}
+            for u, v, data in self.G.edges(data=True)])
+        self._topo_json_ver = self._topo_version
 
     # -------------------- Stats --------------------
+    def _recompute_poll_set(self):
+        """Greedy vertex cover: every link keeps at least one polled end."""
+        if not self.poll_cover: return
+        edges={frozenset((u,v)) for u,v in self.G.edges() if u!=v}
+        cover={n for n in self.G.nodes() if self.G.degree(n)==0}
+        while edges:
+            deg=defaultdict(int)
+            for e in edges:
+                for n in e: deg[n]+=1
+            best=max(deg, key=lambda n: (deg[n], -n))
+            cover.add(best)
+            edges={e for e in edges if best not in e}
+        self._poll_set=cover
+
+    def _poll_targets(self):
+        if not self.poll_cover:
+            return list(self.datapaths.values())
+        dpids=self._poll_set | {h['dpid'] for h in self.hosts.values()}
+        return [dp for dpid,dp in list(self.datapaths.items()) if dpid in dpids]
+
     def _monitor(self):
         while True:
             try:
-                for dp in list(self.datapaths.values()):
-                    p=dp.ofproto_parser
-                    dp.send_msg(p.OFPPortStatsRequest(dp,0,dp.ofproto.OFPP_ANY))
-                    dp.send_msg(p.OFPFlowStatsRequest(dp))
+                now=_now()
+                poll_flows=(now-self._last_flow_poll>=self.flow_poll_interval
+                            and now-self._flow_stats_last_read<self.flow_read_window)
+                if poll_flows: self._last_flow_poll=now
+                # OF1.3 only (OFP_VERSIONS): resolve the classes once per tick
+                port_req=ofproto_v1_3_parser.OFPPortStatsRequest
+                flow_req=ofproto_v1_3_parser.OFPFlowStatsRequest
+                port_any=ofproto_v1_3.OFPP_ANY
+                due=self._port_poll_due
+                for dp in self._poll_targets():
+                    msgs=[port_req(dp,0,port_any)] if now>=due.get(dp.id,0.0) else []
+                    if poll_flows: msgs.append(flow_req(dp))
+                    if msgs:
+                        self._send_batch(dp,msgs)
+                        self._outstanding.update((dp.id,m.xid) for m in msgs)
             except Exception as e:
                 self.logger.warning("monitor error: %s",e)
             hub.sleep(self.monitor_interval)
+            if self._outstanding:
+                self._round_done.wait(timeout=self.monitor_interval)
+            self._outstanding.clear(); self._round_done.clear()
+
+    def _stats_reply_seen(self, msg):
+        if msg.flags & ofproto_v1_3.OFPMPF_REPLY_MORE: return
+        out=self._outstanding
+        if out:
+            out.discard((msg.datapath.id,msg.xid))
+            if not out: self._round_done.set()
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def port_stats_reply(self, ev):
-        now=time.time(); stats=[]; rates=[]
-        for s in ev.msg.body:
-            rec={'timestamp':now,'dpid':ev.msg.datapath.id,'port_no':s.port_no,
-                 'rx_bytes':s.rx_bytes,'tx_bytes':s.tx_bytes,
-                 'rx_pkts':s.rx_packets,'tx_pkts':s.tx_packets,
-                 'rx_dropped':s.rx_dropped,'tx_dropped':s.tx_dropped,
-                 'rx_errors':s.rx_errors,'tx_errors':s.tx_errors}
-            stats.append(rec)
-            key=(rec['dpid'],rec['port_no'])
-            prev=self.port_prev.get(key)
-            if prev:
-                dt=max(1e-6,now-prev['ts'])
-                rates.append({
-                    'timestamp':now,'dpid':rec['dpid'],'port_no':rec['port_no'],
-                    'tx_bps':(rec['tx_bytes']-prev['tx_bytes'])*8.0/dt,
-                    'rx_bps':(rec['rx_bytes']-prev['rx_bytes'])*8.0/dt})
-            self.port_prev[key]={**rec,'ts':now}
-        self.port_stats=[x for x in self.port_stats if x['dpid']!=ev.msg.datapath.id]+stats
-        self.port_rates=[x for x in self.port_rates if x['dpid']!=ev.msg.datapath.id]+rates
+        now,mono=time.time(),_now(); dpid=ev.msg.datapath.id
+        self._stats_reply_seen(ev.msg)
+        body=self._replies.full_body('ports',ev.msg)
+        if body is None: return
+        # All counters of the reply as one matrix; the rate counters taken
+        # from it make the deltas against the previous reply one vectorized step
+        ports=[s.port_no for s in body]
+        stats=port_stat_matrix(body)
+        curr=port_counters(stats)
+        prev=self.port_prev.get(dpid)
+        # idle only if nothing moved: a port dropping or erroring is not idle
+        if counters_unchanged(self.port_stats_by_dpid.get(dpid),ports,stats):
+            if dpid in self._idle_dpids:
+                # Still idle: rows and zero rates from the last reply stand,
+                # only the rate baseline moves forward
+                self.port_prev[dpid]=(mono,prev[1],prev[2])
+                self.last_stats_ts=now
+                self._schedule_port_poll(dpid,mono,True)
+                return
+            self._idle_dpids.add(dpid)
+        else:
+            self._idle_dpids.discard(dpid)
+        rates={}
+        if prev is not None:
+            prev_ts,prev_row,prev_ctr=prev
+            dt=max(1e-6,mono-prev_ts)
+            sel=[prev_row.get(p,-1) for p in ports]
+            rows=[i for i,r in enumerate(sel) if r>=0]
+            if rows:
+                # a counter that went backwards (port reset) reads as idle
+                delta=np.maximum(curr[rows]-prev_ctr[[sel[i] for i in rows]],0)
+                per_s=delta*(_RATE_SCALE/dt)
+                for i,(tx,rx,txp,rxp) in zip(rows,per_s.tolist()):
+                    rates[ports[i]]={'timestamp':now,'dpid':dpid,'port_no':ports[i],
+                                     'tx_bps':tx,'rx_bps':rx,'tx_pps':txp,'rx_pps':rxp}
+        self.port_prev[dpid]=(mono,{p:i for i,p in enumerate(ports)},curr)
+        self.port_stats_by_dpid[dpid]=(now,ports,stats)
+        self.port_rates[dpid]=rates
         self.last_stats_ts=now
+        self._schedule_port_poll(dpid,mono,dpid in self._idle_dpids)
+        self._mark_stats_dirty('ports')
+
+    def _schedule_port_poll(self, dpid, now, idle):
+        if self.port_poll_backoff==1: return
+        mult=min(self._port_backoff.get(dpid,1)*2,self.port_poll_backoff) if idle else 1
+        self._port_backoff[dpid]=mult
+        # half an interval of slack: replies land just after the tick that asked
+        self._port_poll_due[dpid]=now+(mult-0.5)*self.monitor_interval
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def flow_stats_reply(self, ev):
-        now=time.time(); flows=[]
-        for s in ev.msg.body:
-            flows.append({
-                'timestamp':now,'dpid':ev.msg.datapath.id,'priority':s.priority,
-                'table_id':s.table_id,'packet_count':s.packet_count,
-                'byte_count':s.byte_count})
-        self.flow_stats=[f for f in self.flow_stats if f['dpid']!=ev.msg.datapath.id]+flows
+        msg=ev.msg; now=time.time(); dpid=msg.datapath.id
+        self._stats_reply_seen(msg)
+        body=self._replies.full_body('flows',msg)
+        if body is None: return
+        self.flow_stats_by_dpid[dpid]=deque(flow_stat_rows(dpid,now,body),
+                                            maxlen=MAX_STATS_ROWS)
         self.last_stats_ts=now
+        self._mark_stats_dirty('flows')
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed(self, ev):
+        m=ev.msg
+        self.flow_removed_stats.append({
+            'timestamp':time.time(),'dpid':m.datapath.id,'cookie':m.cookie,
+            'priority':m.priority,'table_id':m.table_id,'reason':m.reason,
+            'duration_sec':m.duration_sec,'packet_count':m.packet_count,
+            'byte_count':m.byte_count})
+        # an expired route flow must be sent again on the next install
+        eth_dst=m.match.get('eth_dst')
+        if eth_dst:
+            key=(m.datapath.id,mac_bytes(eth_dst))
+            if self._installed.get(key,(None,))[0]==m.cookie:
+                del self._installed[key]
+
+    def _forget_installed(self, dpids=None, cookie=None):
+        """Drop install-cache entries on the given switches or with the given cookie."""
+        self._installed={k:v for k,v in self._installed.items()
+                         if not ((dpids is not None and k[0] in dpids)
+                                 or (cookie is not None and v[0]==cookie))}
+
+    def _mark_stats_dirty(self, which):
+        self._stats_dirty.add(which)
+        if not self._flush_pending:
+            self._flush_pending = True
+            hub.spawn_after(self.stats_flush_delay, self._flush_stats)
+
+    def _flush_stats(self):
+        """Re-encode the snapshots touched since the last flush."""
+        self._flush_pending = False
+        dirty, self._stats_dirty = self._stats_dirty, set()
+        if 'ports' in dirty:
+            self._port_stats_json = dumps(self._port_stat_rows())
+            self._port_rates_json = dumps(list(chain.from_iterable(
+                r.values() for r in self.port_rates.values())))
+            self._port_stats_ver += 1
+        if 'flows' in dirty:
+            self._flow_stats_json = dumps(list(chain.from_iterable(self.flow_stats_by_dpid.values())))
+            self._flow_stats_ver += 1
+
+    def _links_json_snapshot(self):
+        """Encoded /metrics/links; rates change per stats flush, ports per topology change."""
+        ver = (self._port_stats_ver, self._topo_version)
+        if self._links_json[0] != ver:
+            self._links_json = (ver, dumps(self._links_with_tx_bps()))
+        return self._links_json[1]
+
+    def _hosts_json_snapshot(self):
+        """Encoded /hosts; hosts behind a port that became a core port are hidden."""
+        ver = (self._hosts_version, self._topo_version)
+        if self._hosts_json[0] != ver:
+            core = self.core_ports
+            self._hosts_json = (ver, dumps([
+                {'mac': m.hex(':'), 'dpid': h['dpid'], 'port': h['port']}
+                for m, h in self.hosts.items()
+                if h['port'] not in core.get(h['dpid'], _NO_PORTS)]))
+        return self._hosts_json[1]
+
+    def _routes_json_snapshot(self):
+        """Encoded /actions/list, rebuilt only after routes changed."""
+        ver, body = self._routes_json
+        if ver != self._routes_version:
+            body = dumps([{'src_mac': s, 'dst_mac': d,
+                           'cookie': meta.get('cookie'),
+                           'path': meta.get('path'),
+                           'committed': meta.get('committed', False),
+                           'failed': meta.get('failed', False)}
+                          for (s, d), meta in self.routes.items()])
+            self._routes_json = (self._routes_version, body)
+        return body
+
+    def _openapi_doc(self):
+        """docs/openapi.yaml bytes, re-read (and recompressed) only when its mtime changes."""
+        try:
+            etag = 'o%d' % os.stat(OPENAPI_PATH).st_mtime_ns
+            if etag != self._openapi_etag:
+                with open(OPENAPI_PATH, 'rb') as fh:
+                    body = fh.read()
+                self._openapi_gzip = gzip.compress(body, mtime=0)
+                self._openapi_bytes, self._openapi_etag = body, etag
+        except OSError as e:
+            if self._openapi_bytes is not None or self._openapi_etag is None:
+                self.logger.warning("openapi.yaml not served: %s", e)
+            self._openapi_bytes = self._openapi_gzip = None
+            self._openapi_etag = ''
+        return self._openapi_bytes
+
+    def _stats_msgpack(self, which):
+        """msgpack form of the 'ports'/'flows' snapshot, packed once per version."""
+        ver = self._port_stats_ver if which == 'ports' else self._flow_stats_ver
+        cached = self._msgpack_cache.get(which)
+        if cached is None or cached[0] != ver:
+            if which == 'ports':
+                rows = self._port_stat_rows()
+            else:
+                rows = list(chain.from_iterable(self.flow_stats_by_dpid.values()))
+            cached = (ver, msgpack.packb(rows, use_bin_type=True))
+            self._msgpack_cache[which] = cached
+        return cached[1]
+
+    def _port_stat_rows(self):
+        """Row view of port stats (one record per port), built from the stored matrices."""
+        return list(chain.from_iterable(port_stat_records(dpid, *stored)
+                                        for dpid, stored in self.port_stats_by_dpid.items()))
+
+    def _port_stats_columnar(self):
+        """Columnar view of port stats ({column: [values]}), encoded once per version."""
+        ver, body = self._port_cols_cache
+        if ver != self._port_stats_ver:
+            body = dumps(port_stat_columns(self.port_stats_by_dpid))
+            self._port_cols_cache = (self._port_stats_ver, body)
+        return body
 
     # -------------------- Path Helpers --------------------
     def _k_shortest_paths(self, src, dst, k=2):
         """
         Deterministic k-shortest simple paths (stable order):
-        - Generate with networkx
+        - Generate with Yen over a CSR snapshot of the graph
         - Keep first k
         - Sort by (length, tuple(dpids)) to break ties stably
+        Results are keyed on the paths version, so entries from before a
+        link add are simply never hit again and age out of the LRU; a link
+        or switch removal only drops the entries whose paths crossed it.
         """
         if src==dst: return []
-        key=(src,dst,k)
-        if key in self.k_paths_cached: return self.k_paths_cached[key]
+        cache=self.k_paths_cached
+        key=(self._paths_version,src,dst,k)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        if self._sp_version!=self._paths_version:
+            self._sp_trees.clear(); self._sp_version=self._paths_version
+        removed=self._edges_removed
         try:
-            gen = nx.shortest_simple_paths(self.G, src, dst)
-            paths = []
-            for p in gen:
-                if len(p) >= 2:
-                    paths.append(p)
-                if len(paths) >= k:
-                    break
-            # stable order on ties
-            paths = sorted(paths, key=lambda seq: (len(seq), tuple(seq)))
-            self.k_paths_cached[key]=paths
+            if k==1:
+                # one BFS per source serves every destination
+                tree=self._sp_trees.get(src)
+                if tree is None:
+                    tree=self._sp_trees[src]=nx.single_source_shortest_path(self.G, src)
+                p=tree.get(dst)
+                paths=[p] if p and len(p)>=2 else []
+                self._cache_paths(key,paths)
+                return paths
+            graph=self._path_graph()
+            if len(graph.nodes)>=self.path_offload_min_nodes:
+                # Yen is pure-Python CPU work: run it on an OS thread (the
+                # snapshot is immutable) so packet-ins and stats keep flowing
+                paths=tpool.execute(graph.k_shortest, src, dst, k, self.path_max_stretch)
+            else:
+                paths=graph.k_shortest(src, dst, k, self.path_max_stretch)
+            # a removal while the search ran may not be reflected in it
+            if removed==self._edges_removed: self._cache_paths(key,paths)
             return paths
         except Exception:
             return []
 
+    def _path_graph(self):
+        """CSR snapshot of G, rebuilt lazily after a topology change."""
+        if self._csr_ver!=self._topo_version:
+            self._csr=CSRGraph(self.G); self._csr_ver=self._topo_version
+        return self._csr
+
+    def _cache_paths(self, key, paths):
+        self.k_paths_cached[key]=paths
+        self._index_paths(key,paths,True)
+        if len(self.k_paths_cached)>PATH_CACHE_SIZE:
+            self._index_paths(*self.k_paths_cached.popitem(last=False),False)
+
+    def _index_paths(self, key, paths, add):
+        index=self._path_index
+        for p in paths:
+            for e in zip(p,p[1:]):
+                if add:
+                    index[e].add(key)
+                else:
+                    keys=index.get(e)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys: del index[e]
+
+    def _invalidate_edges(self, edges):
+        """Drop cached paths and BFS trees that use any of the removed edges."""
+        self._edges_removed+=1
+        cache=self.k_paths_cached
+        for e in edges:
+            for key in self._path_index.pop(e,()):
+                paths=cache.pop(key,None)
+                if paths: self._index_paths(key,paths,False)
+        # a BFS tree uses (u,v) iff v is reached through u
+        for src,tree in list(self._sp_trees.items()):
+            for u,v in edges:
+                p=tree.get(v)
+                if p is not None and len(p)>=2 and p[-2]==u:
+                    del self._sp_trees[src]; break
+
+    def _host(self, mac):
+        """hosts entry for a text MAC, or None."""
+        b=mac_bytes(mac)
+        return self.hosts.get(b) if b else None
+
+    def _hops_memo(self):
+        """(path, dst_mac) -> hops, valid until the topology or a host moves."""
+        ver=(self._topo_version,self._hosts_version)
+        if self._hops_ver!=ver or len(self._hops_cache)>PATH_CACHE_SIZE:
+            self._hops_cache.clear(); self._hops_ver=ver
+        return self._hops_cache
+
     def _path_ports(self, dpids, dst_mac=None):
-        hops=[]
-        for i in range(len(dpids)-1):
-            u,v=dpids[i],dpids[i+1]
-            data=self.G.get_edge_data(u,v)
-            if not data: return []
-            hops.append({'dpid':u,'out_port':data.get('u_port')})
-        last=dpids[-1]
-        if dst_mac and dst_mac in self.hosts and self.hosts[dst_mac]['dpid']==last:
-            hops.append({'dpid':last,'out_port':self.hosts[dst_mac]['port']})
+        """Per-hop output ports along dpids."""
+        cache=self._hops_memo()
+        key=(tuple(dpids),dst_mac)
+        hops=cache.get(key)
+        if hops is None:
+            hops=cache[key]=self._walk_path_ports(dpids,None,dst_mac)[0]
         return hops
 
-    def _install_path(self, src_mac, dst_mac, dpids):
-        cookie=int(hashlib.md5(f"{src_mac}->{dst_mac}".encode()).hexdigest()[:16],16)
-        for hop in self._path_ports(dpids,dst_mac):
-            dp=self.datapaths.get(hop['dpid'])
-            if not dp: continue
-            p,ofp=dp.ofproto_parser,dp.ofproto
-            match=p.OFPMatch(eth_dst=dst_mac)
-            act=[p.OFPActionOutput(hop['out_port'])]
-            inst=[p.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS,act)]
-            dp.send_msg(p.OFPFlowMod(datapath=dp,priority=100,match=match,
-                                     instructions=inst,cookie=cookie,idle_timeout=60))
-        self.routes[(src_mac,dst_mac)]={'cookie':cookie,'path':dpids}
-        self.last_action_ts[(src_mac,dst_mac)]=time.time()
+    def _path_ports_bidir(self, dpids, src_mac, dst_mac):
+        """Hops along dpids and along its reverse, from a single walk."""
+        cache=self._hops_memo()
+        fkey=(tuple(dpids),dst_mac); rkey=(fkey[0][::-1],src_mac)
+        fwd,rev=cache.get(fkey),cache.get(rkey)
+        if fwd is None or rev is None:
+            fwd,rev=self._walk_path_ports(dpids,src_mac,dst_mac)
+            cache[fkey]=fwd; cache[rkey]=rev
+        return fwd,rev
+
+    def _walk_path_ports(self, dpids, src_mac, dst_mac):
+        # Both edge directions carry the same ports: u_port leaves u towards
+        # v, v_port leaves v back towards u
+        fwd,rev=[],[]
+        G=self.G
+        for u,v in zip(dpids,dpids[1:]):
+            data=G.get_edge_data(u,v)
+            if not data: return [],[]
+            fwd.append({'dpid':u,'out_port':data.get('u_port')})
+            rev.append({'dpid':v,'out_port':data.get('v_port')})
+        rev.reverse()
+        for hops,last,mac in ((fwd,dpids[-1],dst_mac),(rev,dpids[0],src_mac)):
+            h=self._host(mac) if mac else None
+            if h is not None and h['dpid']==last:
+                hops.append({'dpid':last,'out_port':h['port']})
+        return fwd,rev
+
+    def _cookie_for_pair(self, src_mac, dst_mac):
+        """
+        OpenFlow cookie for a (src,dst) route: a counter, stable for the
+        pair until its route is deleted (a later install then gets a new
+        one). The high 32 bits are random per process, so a restarted
+        controller does not hand out cookies still held by flows of the
+        previous run; counting up from there never yields cookie 0
+        (table-miss and L2 flows), which stays out of reach of a route delete.
+        """
+        key=(src_mac,dst_mac)
+        cookie=self._cookie_cache.get(key)
+        if cookie is None:
+            self._cookie_seq+=1
+            cookie=self._cookie_cache[key]=self._cookie_seq
+        return cookie
+
+    def _path_mods(self, src_mac, dst_mac, dpids, hops, by_dp, installs):
+        """Queue one direction's FlowMods into by_dp[dpid] and their install-cache
+        entries into installs[dpid]; returns the route meta."""
+        cookie=self._cookie_for_pair(src_mac,dst_mac)
+        # Every switch speaks OF1.3 (OFP_VERSIONS), so bind the parser names
+        # and the match (same eth_dst on every hop) once, outside the loop
+        p,ofp=ofproto_v1_3_parser,ofproto_v1_3
+        FlowMod,Output,Actions=p.OFPFlowMod,p.OFPActionOutput,p.OFPInstructionActions
+        apply_actions,flags=ofp.OFPIT_APPLY_ACTIONS,ofp.OFPFF_SEND_FLOW_REM
+        match=p.OFPMatch(eth_dst=dst_mac)
+        datapaths,installed,dst=self.datapaths,self._installed,mac_bytes(dst_mac)
+        for hop in hops:
+            dp=datapaths[hop['dpid']]
+            # overlapping routes share core hops: skip a mod the switch already holds
+            key,val=(dp.id,dst),(cookie,hop['out_port'])
+            if installed.get(key)==val: continue
+            # unknown until the barrier confirms it
+            installed.pop(key,None)
+            installs.setdefault(dp.id,[]).append((key,val))
+            inst=[Actions(apply_actions,[Output(hop['out_port'])])]
+            by_dp.setdefault(dp.id,[]).append(
+                FlowMod(datapath=dp,priority=100,match=match,
+                        instructions=inst,cookie=cookie,idle_timeout=60,
+                        flags=flags))
+        meta={'cookie':cookie,'path':dpids,'committed':False,'failed':False,'pending':set()}
+        self.routes[(src_mac,dst_mac)]=meta
+        self._routes_version+=1
+        self.last_action_ts[(src_mac,dst_mac)]=_now()
+        return meta
+
+    def _install_route(self, src_mac, dst_mac, dpids):
+        """
+        Install both directions of a route. Each switch gets all of its
+        FlowMods and one barrier in a single write; the route is marked
+        committed once every touched switch has answered its barrier.
+        Returns False, sending nothing, if a link or switch of the path is
+        gone.
+        """
+        by_dp,installs={},{}
+        fwd,rev=self._path_ports_bidir(dpids,src_mac,dst_mac)
+        if not fwd or not rev or any(h['dpid'] not in self.datapaths for h in fwd+rev):
+            return False
+        metas=(self._path_mods(src_mac,dst_mac,dpids,fwd,by_dp,installs),
+               self._path_mods(dst_mac,src_mac,dpids[::-1],rev,by_dp,installs))
+        for dpid,mods in by_dp.items():
+            dp=self.datapaths[dpid]
+            msgs=self._bundle_msgs(dp,mods) if self.use_bundles else mods
+            barrier=ofproto_v1_3_parser.OFPBarrierRequest(dp)
+            self._send_batch(dp,msgs+[barrier])
+            self._barriers.add(dpid,msgs[0].xid,barrier.xid,metas,installs[dpid])
+        if not by_dp:
+            # every hop was already in place
+            for meta in metas: meta['committed']=True
+        return True
+
+    def _bundle_msgs(self, dp, mods):
+        """Wrap mods in open/add/commit of one bundle, so the switch swaps
+        the route in one step instead of mod by mod."""
+        p,ofp=ofproto_v1_3_parser,ofproto_v1_3
+        self._bundle_seq=(self._bundle_seq+1)&0xffffffff
+        bid,flags=self._bundle_seq,ofp.ONF_BF_ATOMIC|ofp.ONF_BF_ORDERED
+        return ([p.ONFBundleCtrlMsg(dp,bid,ofp.ONF_BCT_OPEN_REQUEST,flags,[])]
+                +[p.ONFBundleAddMsg(dp,bid,flags,mod,[]) for mod in mods]
+                +[p.ONFBundleCtrlMsg(dp,bid,ofp.ONF_BCT_COMMIT_REQUEST,flags,[])])
+
+    def _send_batch(self, dp, msgs):
+        """Queue msgs as one buffer: a single socket write instead of one
+        per message. xids are assigned here, as send_msg would."""
+        for m in msgs:
+            dp.set_xid(m); m.serialize()
+        dp.send(b''.join(m.buf for m in msgs))
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply(self, ev):
+        installs=self._barriers.reply(ev.msg.datapath.id,ev.msg.xid)
+        if installs is None: return
+        # the switch has processed the batch; a rejected one has no installs left
+        self._installed.update(installs)
+        self._routes_version+=1
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def error_msg(self, ev):
+        """A rejected route FlowMod (or bundle): fail its route and keep its
+        hops out of the install cache, so the next request sends them again."""
+        m=ev.msg
+        if self._barriers.error(m.datapath.id,m.xid):
+            self._routes_version+=1
+            self.logger.warning("route mod rejected by %s: type=%s code=%s",
+                                m.datapath.id,m.type,m.code)
 
     def _links_with_tx_bps(self):
         out=[]
-        idx=defaultdict(dict)
-        for r in self.port_rates:
-            idx[r['dpid']][r['port_no']]=r.get('tx_bps',0.0)
+        idx=self.port_rates
         for u,v,data in self.G.edges(data=True):
+            r=idx.get(u,{}).get(data.get('u_port'))
+            if r is not None:
+                tx_bps=r.get('tx_bps',0.0)
+            else:
+                # u not polled (POLL_COVER): what v received is what u sent
+                peer=idx.get(v,{}).get(data.get('v_port'))
+                tx_bps=peer.get('rx_bps',0.0) if peer else 0.0
             out.append({'src_dpid':u,'dst_dpid':v,
                         'src_port':data.get('u_port'),'dst_port':data.get('v_port'),
-                        'tx_bps':idx.get(u,{}).get(data.get('u_port'),0.0)})
+                        'tx_bps':tx_bps})
         return out
 
 
@@ -280,45 +916,72 @@ class RESTController(ControllerBase):
         super().__init__(req, link, data, **config)
         self.app: SDNRouterREST = data[API_INSTANCE]
 
+    def _cached(self, req, body, version, *args, **kwargs):
+        """j_cached under an ETag for `version` of this controller process."""
+        return j_cached(req, body, self.app.etag(version), *args, **kwargs)
+
     @route('health', '/api/v1/health', methods=['GET'])
     def health(self, req, **kwargs):
         return j({'status':'ok','last_stats_ts':self.app.last_stats_ts})
 
+    @route('openapi', '/api/v1/openapi.yaml', methods=['GET'])
+    def openapi(self, req, **kwargs):
+        app=self.app
+        body=app._openapi_doc()
+        if body is None: return j({'error':'not_found'},404)
+        # q-values count: 'gzip;q=0' refuses gzip; no header means identity
+        if ('Accept-Encoding' in req.headers
+                and req.accept_encoding.best_match(['gzip','identity'])=='gzip'):
+            return self._cached(req, app._openapi_gzip, app._openapi_etag+'.gz',
+                            'application/yaml', [('Content-Encoding','gzip'),
+                                                 ('Vary','Accept-Encoding')])
+        return self._cached(req, body, app._openapi_etag, 'application/yaml',
+                        [('Vary','Accept-Encoding')])
+
     @route('hosts', '/api/v1/hosts', methods=['GET'])
     def hosts(self, req, **kwargs):
-        hosts=[{'mac':m,'dpid':h['dpid'],'port':h['port']}
-               for m,h in self.app.hosts.items()
-               if h['port'] not in self.app.core_ports[h['dpid']]]
-        return j(hosts)
+        app=self.app
+        return self._cached(req, app._hosts_json_snapshot(),
+                        '%d.%d' % (app._hosts_version, app._topo_version))
 
     @route('paths', '/api/v1/paths', methods=['GET'])
     def paths(self, req, **kwargs):
         p=req.params; s=p.get('src_mac'); d=p.get('dst_mac'); k=int(p.get('k',2))
         if not s or not d: return j({'error':'missing src_mac/dst_mac'},400)
-        if s not in self.app.hosts or d not in self.app.hosts: return j({'error':'hosts not learned'},404)
-        sdp,did=self.app.hosts[s]['dpid'],self.app.hosts[d]['dpid']
+        hs,hd=self.app._host(s),self.app._host(d)
+        if hs is None or hd is None: return j({'error':'hosts not learned'},404)
+        sdp,did=hs['dpid'],hd['dpid']
         paths=self.app._k_shortest_paths(sdp,did,k)
         out=[{'path_id':i,'dpids':p,'hops':self.app._path_ports(p,dst_mac=d)} for i,p in enumerate(paths)]
         return j(out)
 
     @route('action_route', '/api/v1/actions/route', methods=['POST'])
     def apply_route(self, req, **kwargs):
+        # refuse oversized bodies before reading or parsing any of them;
+        # a chunked body has no length to check, so read one byte past the limit
+        if (req.content_length or 0)>MAX_ACTION_BODY:
+            return j({'error':'body_too_large','limit':MAX_ACTION_BODY},413)
+        body=req.body_file.read(MAX_ACTION_BODY+1)
+        if len(body)>MAX_ACTION_BODY:
+            return j({'error':'body_too_large','limit':MAX_ACTION_BODY},413)
+        form=req.content_type=='application/x-www-form-urlencoded'
         try:
-            data=json.loads(req.body)
-            validate(instance=data,schema=ROUTE_SCHEMA)
-        except ValidationError as ve:
+            data=route_form(dict(parse_qsl(body.decode()))) if form else loads(body)
+            validate_route(data)
+        except RouteValidationError as ve:
             return j({'error':'validation','detail':ve.message},400)
         except Exception:
-            return j({'error':'invalid_json'},400)
+            return j({'error':'invalid_body' if form else 'invalid_json'},400)
 
         s,d=data['src_mac'],data['dst_mac']
-        if s not in self.app.hosts or d not in self.app.hosts:
+        hs,hd=self.app._host(s),self.app._host(d)
+        if hs is None or hd is None:
             return j({'error':'hosts_not_learned'},404)
 
         # resolve desired path (by explicit list or by path_id)
         paths=data.get('path')
         if not paths:
-            sdp=self.app.hosts[s]['dpid']; ddp=self.app.hosts[d]['dpid']
+            sdp=hs['dpid']; ddp=hd['dpid']
             allp=self.app._k_shortest_paths(sdp,ddp,k=int(data.get('k',2)))
             if not allp: return j({'error':'no_path'},409)
             pid=min(int(data.get('path_id',0)),len(allp)-1)
@@ -327,58 +990,74 @@ class RESTController(ControllerBase):
         key=(s,d)
         prev=self.app.routes.get(key,{}).get('path')
         if prev and prev!=paths:
-            delta=time.time()-self.app.last_action_ts.get(key,0.0)
+            delta=_now()-self.app.last_action_ts.get(key,-INF)
             if delta<self.app.route_cooldown:
                 retry_after = max(0, int(round(self.app.route_cooldown - delta)))
                 return j({'error':'cooldown_active','retry_after':retry_after},
                          429, headers={'Retry-After': str(retry_after)})
 
         # install forward + reverse
-        self.app._install_path(s,d,paths)
-        self.app._install_path(d,s,list(reversed(paths)))
+        if not self.app._install_route(s,d,paths):
+            return j({'error':'path_unavailable'},409)
         return j({'status':'applied','path':paths})
 
     @route('stats_ports','/api/v1/stats/ports',methods=['GET'])
     def stats_ports(self,req,**kw):
-        return j(self.app.port_stats)
+        if req.params.get('format') == 'columnar':
+            return self._cached(req, self.app._port_stats_columnar(),
+                            'c%d' % self.app._port_stats_ver, headers=_VARY_ACCEPT)
+        if wants_msgpack(req):
+            return self._cached(req, self.app._stats_msgpack('ports'),
+                            'm%d' % self.app._port_stats_ver, 'application/msgpack',
+                            _VARY_ACCEPT)
+        return self._cached(req, self.app._port_stats_json, 'j%d' % self.app._port_stats_ver,
+                        headers=_VARY_ACCEPT)
 
     @route('stats_flows','/api/v1/stats/flows',methods=['GET'])
     def stats_flows(self,req,**kw):
-        return j(self.app.flow_stats)
+        app=self.app; now=_now()
+        if now-app._flow_stats_last_read>=app.flow_read_window:
+            # polling was paused: refresh on the next monitor tick
+            app._last_flow_poll=-INF
+        app._flow_stats_last_read=now
+        if wants_msgpack(req):
+            return self._cached(req, self.app._stats_msgpack('flows'),
+                            'm%d' % self.app._flow_stats_ver, 'application/msgpack',
+                            _VARY_ACCEPT)
+        return self._cached(req, self.app._flow_stats_json, 'j%d' % self.app._flow_stats_ver,
+                        headers=_VARY_ACCEPT)
+
+    @route('stats_flows_removed','/api/v1/stats/flows/removed',methods=['GET'])
+    def stats_flows_removed(self,req,**kw):
+        """Final counters of expired/deleted route flows (most recent last)."""
+        return Response(headerlist=[('Content-Type', 'application/json')],
+                        app_iter=iter_json_array(list(self.app.flow_removed_stats)))
 
     @route('metrics_links','/api/v1/metrics/links',methods=['GET'])
     def metrics_links(self,req,**kw):
-        return j(self.app._links_with_tx_bps())
+        app=self.app
+        return self._cached(req, app._links_json_snapshot(),
+                        '%d.%d' % (app._port_stats_ver, app._topo_version))
 
     @route('metrics_ports','/api/v1/metrics/ports',methods=['GET'])
     def metrics_ports(self, req, **kw):
         """Latest per-port rates."""
-        return j(self.app.port_rates)
+        return self._cached(req, self.app._port_rates_json, self.app._port_stats_ver)
 
     # -------- extra topology + actions helpers --------
     @route('topo_nodes', '/api/v1/topology/nodes', methods=['GET'])
     def topo_nodes(self, req, **kwargs):
-        return j(sorted(list(self.app.G.nodes())))
+        self.app._rebuild_topo_json()
+        return self._cached(req, self.app._topo_nodes_json, self.app._topo_version)
 
     @route('topo_links', '/api/v1/topology/links', methods=['GET'])
     def topo_links(self, req, **kwargs):
-        links = []
-        for u, v, data in self.app.G.edges(data=True):
-            links.append({
-                'src_dpid': u, 'dst_dpid': v,
-                'src_port': data.get('u_port'),
-                'dst_port': data.get('v_port')
-            })
-        return j(links)
+        self.app._rebuild_topo_json()
+        return self._cached(req, self.app._topo_links_json, self.app._topo_version)
 
     @route('actions_list', '/api/v1/actions/list', methods=['GET'])
     def actions_list(self, req, **kwargs):
-        out = []
-        for (s, d), meta in self.app.routes.items():
-            out.append({'src_mac': s, 'dst_mac': d,
-                        'cookie': meta.get('cookie'),
-                        'path': meta.get('path')})
-        return j(out)
+        return self._cached(req, self.app._routes_json_snapshot(), self.app._routes_version)
 
     @route('action_route_delete', '/api/v1/actions/route', methods=['DELETE'])
     def route_delete(self, req, **kwargs):
@@ -405,6 +1084,11 @@ class RESTController(ControllerBase):
             )
             dp.send_msg(mod)
 
+        self.app._forget_installed(cookie=cookie)
+        # a later install of the pair gets a fresh cookie, so counters of
+        # the deleted route's flows never mix with the new ones
+        self.app._cookie_cache.pop(key, None)
         self.app.routes.pop(key, None)
+        self.app._routes_version += 1
         self.app.last_action_ts.pop(key, None)
         return j({'status': 'deleted'})
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The controller modules live in controller-apps/, which is not a package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'controller-apps'))
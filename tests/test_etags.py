@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("numpy")
+from sdn_router_core import ETagger  # noqa: E402
+
+
+def test_etag_is_weak_and_carries_the_version():
+    etag = ETagger()
+    assert etag('j3') == 'W/"%s.j3"' % etag.boot_id
+    assert etag('j3') == etag('j3')
+    assert etag('j3') != etag('j4')
+
+
+def test_restarted_instance_never_reuses_an_etag():
+    before, after = ETagger(), ETagger()
+    assert before.boot_id != after.boot_id
+    for version in (0, 1, 'j0', '0.0'):
+        assert before(version) != after(version)
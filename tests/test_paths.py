@@ -0,0 +1,85 @@
+import random
+from itertools import islice
+
+import pytest
+
+pytest.importorskip("numpy")
+nx = pytest.importorskip("networkx")
+from sdn_router_core import CSRGraph  # noqa: E402
+
+
+def _cost(G, path):
+    return sum(G[u][v].get('weight', 1) for u, v in zip(path, path[1:]))
+
+
+def _random_graph(rng, weighted):
+    n = rng.randint(2, 9)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(1, n + 1))
+    for _ in range(rng.randint(1, 3 * n)):
+        u, v = rng.sample(range(1, n + 1), 2)
+        if weighted:
+            G.add_edge(u, v, weight=rng.choice((1, 1, 2, 3)))
+        else:
+            G.add_edge(u, v)
+    return G
+
+
+def _expected_costs(G, s, t, k, max_stretch=None):
+    """Costs of the first k simple paths networkx's Yen finds."""
+    try:
+        paths = list(islice(nx.shortest_simple_paths(G, s, t, weight='weight'), 64))
+    except nx.NetworkXNoPath:
+        return []
+    costs = [_cost(G, p) for p in paths]
+    if max_stretch is not None:
+        costs = [c for c in costs if c <= costs[0] + max_stretch]
+    return costs[:k]
+
+
+def _check(G, s, t, k, max_stretch=None):
+    got = CSRGraph(G).k_shortest(s, t, k, max_stretch)
+    for p in got:
+        assert p[0] == s and p[-1] == t
+        assert len(set(p)) == len(p)
+        assert all(G.has_edge(u, v) for u, v in zip(p, p[1:]))
+    assert len({tuple(p) for p in got}) == len(got)
+    assert got == sorted(got, key=lambda p: (len(p), tuple(p)))
+    assert sorted(_cost(G, p) for p in got) == _expected_costs(G, s, t, k, max_stretch)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_k_shortest_matches_networkx(weighted):
+    rng = random.Random(7)
+    for _ in range(300):
+        G = _random_graph(rng, weighted)
+        s, t = rng.sample(sorted(G.nodes()), 2)
+        _check(G, s, t, rng.randint(1, 6))
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_stretch_bound_and_pruning(weighted):
+    rng = random.Random(11)
+    for _ in range(300):
+        G = _random_graph(rng, weighted)
+        s, t = rng.sample(sorted(G.nodes()), 2)
+        _check(G, s, t, rng.randint(1, 6), max_stretch=rng.choice((0, 1, 2)))
+
+
+def test_tied_shortest_paths_come_in_dpid_order():
+    # four equal two-hop paths 1 -> {2,3,4,5} -> 6
+    G = nx.DiGraph()
+    for m in (5, 3, 4, 2):
+        G.add_edge(1, m)
+        G.add_edge(m, 6)
+    assert CSRGraph(G).k_shortest(1, 6, 3) == [[1, 2, 6], [1, 3, 6], [1, 4, 6]]
+
+
+def test_no_path():
+    G = nx.DiGraph()
+    G.add_edge(1, 2)
+    G.add_node(3)
+    graph = CSRGraph(G)
+    assert graph.k_shortest(1, 3, 2) == []
+    assert graph.k_shortest(1, 1, 2) == []
+    assert graph.k_shortest(1, 99, 2) == []
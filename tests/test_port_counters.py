@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+from sdn_router_core import (PORT_STAT_FIELDS, counters_unchanged, port_counters,  # noqa: E402
+                             port_stat_columns, port_stat_matrix, port_stat_records)
+
+
+def _stat(port_no, tx_bytes, rx_bytes, tx_packets, rx_packets, dropped=0, errors=0):
+    return SimpleNamespace(port_no=port_no, tx_bytes=tx_bytes, rx_bytes=rx_bytes,
+                           tx_packets=tx_packets, rx_packets=rx_packets,
+                           rx_dropped=dropped, tx_dropped=dropped,
+                           rx_errors=errors, tx_errors=errors)
+
+
+def test_unsupported_counter_reads_as_zero():
+    m = port_stat_matrix([_stat(1, 2**64 - 1, 10, 2**64 - 1, 3), _stat(2, 5, 6, 7, 8)])
+    assert port_counters(m).tolist() == [[0, 10, 0, 3], [5, 6, 7, 8]]
+    # the stored matrix keeps what the switch sent
+    assert m[0, 1] == 2**64 - 1
+
+
+def test_empty_reply():
+    m = port_stat_matrix([])
+    assert m.shape == (0, len(PORT_STAT_FIELDS))
+    assert port_counters(m).shape == (0, 4)
+
+
+def test_idle_needs_every_counter_unchanged():
+    stored = (100.0, [1, 2], port_stat_matrix([_stat(1, 1, 2, 3, 4), _stat(2, 5, 6, 7, 8)]))
+    same = port_stat_matrix([_stat(1, 1, 2, 3, 4), _stat(2, 5, 6, 7, 8)])
+    assert counters_unchanged(stored, [1, 2], same)
+    assert not counters_unchanged(None, [1, 2], same)
+    assert not counters_unchanged(stored, [2, 1], same)
+    # only a drop counter moved: the bytes/packets are flat, the switch is not idle
+    dropped = port_stat_matrix([_stat(1, 1, 2, 3, 4), _stat(2, 5, 6, 7, 8, dropped=1)])
+    assert (port_counters(dropped) == port_counters(same)).all()
+    assert not counters_unchanged(stored, [1, 2], dropped)
+    errored = port_stat_matrix([_stat(1, 1, 2, 3, 4, errors=2), _stat(2, 5, 6, 7, 8)])
+    assert not counters_unchanged(stored, [1, 2], errored)
+
+
+def test_row_and_columnar_views_agree():
+    stored = {1: (100.0, [1, 2], port_stat_matrix([_stat(1, 1, 2, 3, 4, 5, 6),
+                                                    _stat(2, 7, 8, 9, 10)])),
+              2: (101.0, [3], port_stat_matrix([_stat(3, 11, 12, 13, 14, errors=1)]))}
+    rows = [r for dpid, s in stored.items() for r in port_stat_records(dpid, *s)]
+    assert rows[0] == {'timestamp': 100.0, 'dpid': 1, 'port_no': 1,
+                       'rx_bytes': 2, 'tx_bytes': 1, 'rx_pkts': 4, 'tx_pkts': 3,
+                       'rx_dropped': 5, 'tx_dropped': 5, 'rx_errors': 6, 'tx_errors': 6}
+    cols = port_stat_columns(stored)
+    assert cols == {c: [r[c] for r in rows] for c in rows[0]}
+    assert all(type(v) is int for v in cols['rx_bytes'])
+
+
+def test_columnar_view_of_nothing():
+    cols = port_stat_columns({})
+    assert set(cols) == {'dpid', 'port_no', 'timestamp', *PORT_STAT_FIELDS}
+    assert not any(cols.values())
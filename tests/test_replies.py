@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+from sdn_router_core import MultipartReplies, RouteBarriers  # noqa: E402
+
+MORE = 1   # OFPMPF_REPLY_MORE
+
+
+def _msg(dpid, xid, body, more=False):
+    return SimpleNamespace(datapath=SimpleNamespace(id=dpid), xid=xid,
+                           flags=MORE if more else 0, body=body)
+
+
+def _meta():
+    return {'pending': set(), 'committed': False, 'failed': False}
+
+
+def test_single_part_reply():
+    r = MultipartReplies(MORE)
+    assert r.full_body('ports', _msg(1, 5, [1, 2])) == [1, 2]
+
+
+def test_parts_are_joined_per_switch_and_kind():
+    r = MultipartReplies(MORE)
+    assert r.full_body('ports', _msg(1, 6, [1, 2], more=True)) is None
+    assert r.full_body('flows', _msg(1, 7, ['f'], more=True)) is None
+    assert r.full_body('ports', _msg(2, 9, [9])) == [9]
+    assert r.full_body('ports', _msg(1, 6, [3], more=True)) is None
+    assert r.full_body('ports', _msg(1, 6, [4])) == [1, 2, 3, 4]
+    assert r.full_body('flows', _msg(1, 7, ['g'])) == ['f', 'g']
+
+
+def test_new_xid_discards_an_unfinished_reply():
+    r = MultipartReplies(MORE)
+    r.full_body('ports', _msg(1, 6, [1], more=True))
+    assert r.full_body('ports', _msg(1, 8, [5])) == [5]
+    r.full_body('ports', _msg(1, 9, [1], more=True))
+    r.drop(1)
+    assert r.full_body('ports', _msg(1, 9, [2])) == [2]
+
+
+def test_route_commits_after_every_barrier():
+    b = RouteBarriers()
+    fwd, rev = _meta(), _meta()
+    b.add(1, 10, 12, (fwd, rev), [('k1', 'v1')])
+    b.add(2, 20, 21, (fwd, rev), [('k2', 'v2')])
+    assert b.reply(1, 12) == [('k1', 'v1')]
+    assert not fwd['committed']
+    assert b.reply(2, 21) == [('k2', 'v2')]
+    assert fwd['committed'] and rev['committed']
+    assert b.reply(2, 21) is None
+
+
+def test_error_fails_the_batch_and_drops_its_installs():
+    b = RouteBarriers()
+    meta = _meta()
+    b.add(1, 10, 12, (meta,), [('k1', 'v1')])
+    assert not b.error(1, 13)          # not one of the batch's xids
+    assert not b.error(2, 11)          # another switch
+    assert b.error(1, 11)
+    assert b.reply(1, 12) == []
+    assert meta['failed'] and not meta['committed']
+
+
+def test_error_matches_across_xid_wrap():
+    b = RouteBarriers()
+    meta = _meta()
+    b.add(1, 0xfffffffe, 1, (meta,), [('k', 'v')])
+    assert b.error(1, 0)
+    assert meta['failed']
+
+
+def test_switch_down_fails_waiting_routes():
+    b = RouteBarriers()
+    meta = _meta()
+    b.add(1, 10, 12, (meta,), [])
+    b.add(2, 20, 21, (meta,), [])
+    assert b.reply(2, 21) == []
+    assert b.switch_down(1)
+    assert meta['pending'] == set()
+    assert meta['failed'] and not meta['committed']
+    assert not b.switch_down(1)